@@ -0,0 +1,122 @@
+import numpy as np
+
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+    # 未安裝 numba 時 njit 為空裝飾器，含迴圈的核心改用檔案末端的向量化版本
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda f: f
+
+# ==========================================
+# 技術指標數值核心 (Indicator Kernels)
+# 輸入皆為不含 NaN 的 float64 ndarray (由呼叫端先剔除缺值)：累加式 MA 遇到 NaN 會汙染之後所有值
+# ==========================================
+
+@njit(cache=True, fastmath=True)
+def _ma(x, w):
+    """簡單移動平均 (單趟累加)，前 w-1 筆為 NaN"""
+    out = np.full(x.shape[0], np.nan)
+    total = 0.0
+    for i in range(x.shape[0]):
+        total += x[i]
+        if i >= w:
+            total -= x[i - w]
+        if i >= w - 1:
+            out[i] = total / w
+    return out
+
+@njit(cache=True, fastmath=True)
+def _rolling_std(x, w, mean):
+    """滑動母體標準差，mean 為同視窗的 _ma 結果"""
+    out = np.full(x.shape[0], np.nan)
+    for i in range(w - 1, x.shape[0]):
+        acc = 0.0
+        for j in range(i - w + 1, i + 1):
+            d = x[j] - mean[i]
+            acc += d * d
+        out[i] = np.sqrt(acc / w)
+    return out
+
+@njit(cache=True)
+def _rsi(close, n):
+    """
+    Wilder RSI 單趟遞推：前 n 個漲跌幅取簡單平均做種子，之後 avg = (avg*(n-1) + x) / n
+    """
+    out = np.full(close.shape[0], np.nan)
+    if close.shape[0] <= n:
+        return out
+
+    gain = 0.0
+    loss = 0.0
+    for i in range(1, close.shape[0]):
+        d = close[i] - close[i - 1]
+        g = d if d > 0 else 0.0
+        l = -d if d < 0 else 0.0
+        if i <= n:
+            gain += g / n
+            loss += l / n
+            if i < n:
+                continue
+        else:
+            gain = (gain * (n - 1) + g) / n
+            loss = (loss * (n - 1) + l) / n
+
+        if loss == 0.0:
+            out[i] = 100.0 if gain > 0.0 else np.nan
+        else:
+            out[i] = 100.0 - 100.0 / (1.0 + gain / loss)
+    return out
+
+@njit(cache=True)
+def _bias(close, ma):
+    """乖離率 (%)"""
+    return (close - ma) / ma * 100
+
+# ==========================================
+# 無 numba 時的向量化版本 (Vectorized Fallback)
+# 以 cumsum / where 取代逐元素 Python 迴圈，結果與上方核心一致
+# ==========================================
+
+if not HAS_NUMBA:
+    import pandas as pd
+
+    def _ma(x, w):
+        """簡單移動平均 (cumsum 差分)，前 w-1 筆為 NaN"""
+        out = np.full(x.shape[0], np.nan)
+        if x.shape[0] >= w:
+            c = np.cumsum(np.concatenate(([0.0], x)))
+            out[w - 1:] = (c[w:] - c[:-w]) / w
+        return out
+
+    def _rolling_std(x, w, mean):
+        """滑動母體標準差 (平方 cumsum)，先平移以減少相消誤差"""
+        out = np.full(x.shape[0], np.nan)
+        if x.shape[0] >= w:
+            shift = x[0]
+            c2 = np.cumsum(np.concatenate(([0.0], (x - shift) ** 2)))
+            var = (c2[w:] - c2[:-w]) / w - (mean[w - 1:] - shift) ** 2
+            out[w - 1:] = np.sqrt(np.maximum(var, 0.0))
+        return out
+
+    def _rsi(close, n):
+        """Wilder RSI：以種子值接上 ewm(adjust=False) 重現相同遞推"""
+        out = np.full(close.shape[0], np.nan)
+        if close.shape[0] <= n:
+            return out
+
+        delta = np.diff(close)
+        smoothed = []
+        for x in (np.where(delta > 0, delta, 0.0), np.where(delta < 0, -delta, 0.0)):
+            seeded = np.concatenate(([x[:n].mean()], x[n:]))
+            smoothed.append(pd.Series(seeded).ewm(alpha=1 / n, adjust=False).mean().to_numpy())
+        gain, loss = smoothed
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rsi = 100.0 - 100.0 / (1.0 + gain / loss)
+        out[n:] = np.where(loss == 0.0, np.where(gain > 0.0, 100.0, np.nan), rsi)
+        return out
@@ -4,8 +4,13 @@ import yfinance as yf
 import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
-import google.generativeai as genai
+from google import genai as google_genai
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from collections import namedtuple
+from _indicators import _ma, _rolling_std, _rsi, _bias
 from datetime import datetime, timedelta
+import re
+import string
 import time
 import random
 
@@ -20,8 +25,8 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# 注入自定義 CSS 以還原 React 版本的玻璃擬態 (Glassmorphism)
-st.markdown("""
+# 自定義 CSS 以還原 React 版本的玻璃擬態 (Glassmorphism)
+_CSS = """
     <style>
     /* 全局背景與字體 */
     .stApp {
@@ -68,6 +73,7 @@ st.markdown("""
     .text-up { color: #f43f5e !important; }
     .text-down { color: #10b981 !important; }
     .text-slate { color: #94a3b8 !important; }
+    .metric-grid { display: grid; grid-template-columns: repeat(4, minmax(0, 1fr)); gap: 1rem; }
     .font-num { font-family: 'Roboto Mono', monospace; letter-spacing: -0.5px; }
 
     /* 策略標籤 */
@@ -103,7 +109,10 @@ st.markdown("""
         border-color: #3b82f6;
     }
     </style>
-""", unsafe_allow_html=True)
+"""
+
+# 每次 rerun 都必須重新注入：未在本輪輸出的元素會被 Streamlit 從頁面移除
+st.markdown(_CSS, unsafe_allow_html=True)
 
 # ==========================================
 # 2. 常數與映射 (Constants)
@@ -120,11 +129,12 @@ SECTOR_MAP = {
     "航運原物料": ["2603", "2609", "2615", "2618", "2002", "1301", "1303", "6505"]
 }
 
+# 反向索引：代號 → 板塊名稱，查詢由線性掃描變為 O(1)
+_SECTOR_INDEX = {sid: name for name, sids in SECTOR_MAP.items() for sid in sids}
+_SECTOR_KEYS = list(SECTOR_MAP.keys())
+
 def get_sector_name(symbol):
-    for name, stocks in SECTOR_MAP.items():
-        if symbol in stocks:
-            return name
-    return "市場標的"
+    return _SECTOR_INDEX.get(symbol, "市場標的")
 
 def get_score_class(score):
     if score >= 80: return "score-high"
@@ -139,41 +149,153 @@ def get_change_color(change):
 # 3. 數據服務層 (Data Service)
 # ==========================================
 
+@st.cache_resource
+def _build_pool():
+    """共用執行緒池：網路 I/O 期間釋放 GIL，跨 rerun 重用不重建"""
+    return ThreadPoolExecutor(max_workers=16, thread_name_prefix="yfinance_pool")
+
+_POOL = _build_pool()
+
+@st.cache_resource(ttl=86400)
+def _suffix_table():
+    """代號 → 上市 (TW) / 上櫃 (TWO) 後綴，跨 rerun 與 session 共用，每天重建一次"""
+    return {}
+
+def _needs_suffix(code):
+    """純台股代號 (數字開頭且未帶 .TW / .TWO 等後綴) 才需要判斷上市櫃別"""
+    return code[:1].isdigit() and "." not in code
+
+def resolve_suffixes(codes):
+    """
+    批量判斷台股代號屬上市或上櫃：未知代號的 .TW / .TWO 候選合併為單次 yf.download，有資料者為準
+    兩個候選都沒有資料 (該檔下載失敗) 時不寫入對照表，下次再試
+    """
+    table = _suffix_table()
+    unknown = [code for code in codes if _needs_suffix(code) and code not in table]
+    if unknown:
+        frames = fetch_many(tuple(f"{code}.{suffix}" for code in unknown for suffix in ("TW", "TWO")))
+        for code in unknown:
+            tw, two = (len(frames.get(f"{code}.{suffix}", ())) for suffix in ("TW", "TWO"))
+            if tw: table[code] = "TW"
+            elif two: table[code] = "TWO"
+    return table
+
+def _time_bucket(seconds):
+    """
+    以時間分桶作為快取鍵 / session_state 鍵的一部分，讓同一時段內的結果共用、跨時段自動換新
+    """
+    return int(time.time() // seconds)
+
 def get_symbol_tw(code):
-    if code.isdigit(): return f"{code}.TW"
     if code.startswith("^"): return code
+    if _needs_suffix(code): return f"{code}.{resolve_suffixes((code,)).get(code, 'TW')}"
     return code
 
+def fetch_many(symbols, period="5d"):
+    """
+    單次 yf.download 批量下載多檔歷史數據，回傳 {Yahoo 代號: DataFrame} (快取由呼叫端負責)
+    """
+    if not symbols: return {}
+    try:
+        raw = yf.download(list(symbols), period=period, group_by="ticker", threads=True, auto_adjust=False, progress=False)
+    except:
+        return {}
+    if raw.empty: return {}
+
+    frames = {}
+    for sym in symbols:
+        if isinstance(raw.columns, pd.MultiIndex):
+            if sym not in raw.columns.get_level_values(0): continue
+            frames[sym] = raw.xs(sym, axis=1, level=0).dropna()
+        else:
+            # 舊版 yfinance 單一代號時回傳單層欄位
+            frames[sym] = raw.dropna()
+    return frames
+
+def _quote_row(code, hist):
+    """由近幾日 K 線產生現價與漲跌幅，資料不足時回傳 None"""
+    if len(hist) < 2: return None
+    closes = hist['Close'].to_numpy()
+    close, prev = float(closes[-1]), float(closes[-2])
+    return {"id": code, "price": close, "change_pct": (close - prev) / prev * 100}
+
+@st.cache_data(ttl=60)
+def fetch_indices(symbols):
+    """
+    大盤指數快照 (單次批量下載)，回傳 {代號: 行情列}
+    """
+    quotes = {}
+    for sym, hist in fetch_many(symbols).items():
+        row = _quote_row(sym, hist)
+        if row: quotes[sym] = row
+    return quotes
+
+def _score_frames(frames):
+    """
+    多檔 K 線合併為 (symbol, Date) 長表，一次 groupby 向量化算出均線與評分輸入
+    評分沿用 ACE 核心 (列表不抓基本面，本益比項不計)，回傳 {代號: 行情列}
+    """
+    frames = {code: hist[['Close', 'Volume']] for code, hist in frames.items() if len(hist) >= 2}
+    if not frames: return {}
+    
+    long = pd.concat(frames, names=['symbol', 'Date'])
+    by_sym = long.groupby(level='symbol')
+    long['Prev'] = by_sym['Close'].shift(1)
+    long['MA20'] = by_sym['Close'].rolling(20).mean().droplevel(0)
+    long['MA60'] = by_sym['Close'].rolling(60).mean().droplevel(0)
+    long['AvgVol5'] = by_sym['Volume'].rolling(5, min_periods=1).mean().droplevel(0)
+    
+    last = by_sym.tail(1)
+    change_pct = ((last['Close'] - last['Prev']) / last['Prev'] * 100).to_numpy()
+    bias = ((last['Close'] - last['MA20']) / last['MA20'] * 100).to_numpy()
+    
+    rows = {}
+    for code, curr, chg, ma20, ma60, vol, avg5, b in zip(
+        last.index.get_level_values('symbol'), last['Close'].to_numpy(), change_pct,
+        last['MA20'].to_numpy(), last['MA60'].to_numpy(), last['Volume'].to_numpy(), last['AvgVol5'].to_numpy(), bias
+    ):
+        score = _ace_score_core(float(curr), float(chg), float(ma20), float(ma60), float(vol), float(avg5), float(b), 0)[0]
+        rows[code] = {
+            "id": code,
+            "price": float(curr),
+            "change_pct": float(chg),
+            "score": score
+        }
+    return rows
+
+def _fetch_one(code):
+    """抓取單一代號近半年行情並評分 (背景板塊掃描用)，失敗回傳 None"""
+    try:
+        hist = yf.Ticker(get_symbol_tw(code)).history(period="6mo")
+        return _score_frames({code: hist}).get(code)
+    except:
+        return None
+
 @st.cache_data(ttl=300)
 def fetch_stock_data_full(symbol_list):
     """
-    批量抓取數據，用於板塊掃描
+    單次批量下載自選清單近半年行情，向量化評分 (名稱等 .info 欄位留待個股頁再抓)
     """
-    data_map = {}
-    for code in symbol_list:
-        try:
-            sym = get_symbol_tw(code)
-            ticker = yf.Ticker(sym)
-            hist = ticker.history(period="5d")
-            if not hist.empty:
-                info = ticker.info
-                # 簡單評分計算 (快速版)
-                close = hist['Close'].iloc[-1]
-                prev = hist['Close'].iloc[-2]
-                change = (close - prev) / prev * 100
-                score = 50 + (change * 2) # 簡易邏輯
-                score = min(99, max(1, int(score)))
-                
-                data_map[code] = {
-                    "id": code,
-                    "name": info.get('longName', code),
-                    "price": close,
-                    "change_pct": change,
-                    "score": score
-                }
-        except:
-            continue
-    return data_map
+    resolve_suffixes(symbol_list)
+    sym_map = {get_symbol_tw(code): code for code in symbol_list}
+    frames = fetch_many(tuple(sym_map), period="6mo")
+    return _score_frames({sym_map[sym]: hist for sym, hist in frames.items()})
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def fetch_fundamentals(sym):
+    """
+    個股頁所需的少數基本面欄位 (經 yfinance 取得 .info，只快取這幾個欄位，一小時更新一次)
+    """
+    try:
+        info = yf.Ticker(sym).info
+    except:
+        return {}
+    fundamentals = {
+        "longName": info.get("longName") or info.get("shortName"),
+        "trailingPE": info.get("trailingPE"),
+        "returnOnEquity": info.get("returnOnEquity"),
+    }
+    return {k: v for k, v in fundamentals.items() if v is not None}
 
 @st.cache_data(ttl=60)
 def get_analysis_data(symbol):
@@ -184,59 +306,95 @@ def get_analysis_data(symbol):
         sym = get_symbol_tw(symbol)
         ticker = yf.Ticker(sym)
         
-        # 1. 歷史數據 (1年)
-        df = ticker.history(period="1y")
-        if df.empty:
-            sym = symbol.replace(".TW", ".TWO") # 嘗試上櫃
-            ticker = yf.Ticker(sym)
-            df = ticker.history(period="1y")
-        
+        # 1. 歷史數據 (1年)；收盤價缺值的列先剔除 (指標核心不接受 NaN，也避免成交量轉整數失敗)
+        df = ticker.history(period="1y").dropna(subset=['Close'])
         if df.empty: return None
         
+        # 價格精度不到 7 位有效數字，float32 已足夠；成交量 (指數、美股大型股) 可能超過 2^31，維持 int64
+        prices = ['Open', 'High', 'Low', 'Close']
+        df[prices] = df[prices].astype(np.float32)
+        df['Volume'] = df['Volume'].fillna(0).astype(np.int64)
+        
         # 2. 基本面 Info
-        info = ticker.info
+        info = fetch_fundamentals(sym)
         
         return {"df": df, "info": info}
     except:
         return None
 
+@st.cache_data(ttl=300, show_spinner=False)
+def _calc_indicators_cached(close):
+    """指標數值核心 (以 ndarray 作為快取鍵，雜湊成本遠低於 DataFrame)"""
+    # MA (MA20 兼作布林中軌，只算一次)
+    ma20 = _ma(close, 20)
+    bb_std = _rolling_std(close, 20, ma20)
+    
+    indicators = {
+        "MA20": ma20,
+        "MA60": _ma(close, 60),
+        # RSI (Wilder 平滑，與 TradingView / PandasTA 一致)
+        "RSI": _rsi(close, 14),
+        "Bias": _bias(close, ma20),
+        # Bollinger
+        "BB_Mid": ma20,
+        "BB_Std": bb_std,
+        "BB_Upper": ma20 + (2 * bb_std),
+        "BB_Lower": ma20 - (2 * bb_std),
+    }
+    # 以 float64 運算後再收窄，快取與 DataFrame 中只保留 float32
+    return {col: values.astype(np.float32, copy=False) for col, values in indicators.items()}
+
 def calculate_technical_indicators(df):
-    """計算完整技術指標"""
-    # MA
-    df['MA20'] = df['Close'].rolling(window=20).mean()
-    df['MA60'] = df['Close'].rolling(window=60).mean()
-    
-    # RSI
-    delta = df['Close'].diff()
-    gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-    loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-    rs = gain / loss
-    df['RSI'] = 100 - (100 / (1 + rs))
-    
-    # Bollinger
-    df['BB_Mid'] = df['Close'].rolling(window=20).mean()
-    df['BB_Std'] = df['Close'].rolling(window=20).std()
-    df['BB_Upper'] = df['BB_Mid'] + (2 * df['BB_Std'])
-    df['BB_Lower'] = df['BB_Mid'] - (2 * df['BB_Std'])
+    """計算完整技術指標 (df 已由 get_analysis_data 剔除收盤價缺值的列)"""
+    for col, values in _calc_indicators_cached(df['Close'].to_numpy(dtype=np.float64)).items():
+        df[col] = values
     
     return df
 
-def calculate_ace_score(df, info):
+Stats = namedtuple('Stats', 'curr prev change_pct ma20 ma60 rsi vol avg_vol5 hi60 lo60 hivol_price bias')
+
+def _compute_stats(arr, ma20, ma60, rsi, bias):
+    """
+    一次算出個股頁所需的全部純量 (arr 欄位順序: Open, High, Low, Close, Volume)
+    """
+    close = arr[:, 3]
+    vol = arr[:, 4]
+    curr = float(close[-1])
+    prev = float(close[-2])
+    last_60 = arr[-60:]
+    return Stats(
+        curr=curr,
+        prev=prev,
+        change_pct=(curr - prev) / prev * 100,
+        ma20=float(ma20[-1]),
+        ma60=float(ma60[-1]),
+        rsi=float(rsi[-1]),
+        vol=float(vol[-1]),
+        avg_vol5=float(vol[-5:].mean()),
+        hi60=float(last_60[:, 3].max()),
+        lo60=float(last_60[:, 3].min()),
+        hivol_price=float(last_60[last_60[:, 4].argmax(), 3]),
+        bias=float(bias[-1])
+    )
+
+def calculate_ace_score(close, vol, ma20_last, ma60_last, info):
     """
     移植 React 版的評分邏輯 (Ace Trader Logic)
+    close / vol 為收盤價與成交量的 ndarray，只取最後幾筆純量
     """
+    curr = float(close[-1])
+    prev = float(close[-2])
+    change_pct = (curr - prev) / prev * 100
+    vol_now = float(vol[-1])
+    avg5 = float(vol[-5:].mean())
+    bias = (curr - ma20_last) / ma20_last * 100
+    return _ace_score_core(curr, change_pct, ma20_last, ma60_last, vol_now, avg5, bias, info.get('trailingPE', 0))
+
+def _ace_score_core(curr, change_pct, ma20, ma60, vol, avg_vol_5, bias, pe):
+    """評分核心，只依賴純量輸入"""
     score = 50
     reasons = []
     
-    curr = df['Close'].iloc[-1]
-    prev = df['Close'].iloc[-2]
-    change_pct = ((curr - prev) / prev) * 100
-    
-    ma20 = df['MA20'].iloc[-1]
-    ma60 = df['MA60'].iloc[-1]
-    vol = df['Volume'].iloc[-1]
-    avg_vol_5 = df['Volume'].tail(5).mean()
-    
     # 1. 動能面
     if 3 < change_pct < 7: score += 8; reasons.append("動能強勁")
     elif change_pct >= 7: score += 5; reasons.append("強勢漲停")
@@ -256,11 +414,9 @@ def calculate_ace_score(df, info):
             score -= 10; reasons.append("跌破月線")
             
     # 4. 乖離率
-    bias = ((curr - ma20) / ma20) * 100
     if bias > 15: score -= 5; reasons.append("短線過熱")
     
     # 5. 基本面 (簡單估值)
-    pe = info.get('trailingPE', 0)
     if pe and 0 < pe < 15: score += 5; reasons.append("低本益比")
     
     final_score = min(100, max(0, int(score)))
@@ -273,8 +429,31 @@ def calculate_ace_score(df, info):
     
     return final_score, action, reasons, bias
 
+@st.cache_data(ttl=60, show_spinner=False)
+def analyze_stock(symbol, bucket):
+    """
+    個股完整分析流程：歷史數據 → 技術指標 → 統計量 → ACE 評分
+    整體以 (代號, 時間分桶) 快取，個股頁、自選批次診斷與排程分析共用同一份結果
+    """
+    data = get_analysis_data(symbol)
+    if not data: return None
+    
+    df = calculate_technical_indicators(data['df'])
+    info = data['info']
+    arr = df[['Open', 'High', 'Low', 'Close', 'Volume']].to_numpy()
+    stats = _compute_stats(arr, df['MA20'].to_numpy(), df['MA60'].to_numpy(), df['RSI'].to_numpy(), df['Bias'].to_numpy())
+    score, action, reasons, bias = calculate_ace_score(arr[:, 3], arr[:, 4], stats.ma20, stats.ma60, info)
+    
+    return {
+        "symbol": symbol, "df": df, "info": info, "stats": stats,
+        "score": score, "action": action, "reasons": reasons, "bias": bias
+    }
+
 def calculate_strategy(price, score, roe):
-    """計算進出策略點位"""
+    """
+    計算進出策略點位，回傳扁平 tuple：
+    (動能進場, 動能停損, 動能停利, 價值進場, 價值停損, 價值停利)
+    """
     # 簡單模擬策略演算法
     tick = 0.05 if price < 50 else 0.1 if price < 100 else 0.5 if price < 500 else 1
     
@@ -288,94 +467,249 @@ def calculate_strategy(price, score, roe):
     val_stop = val_entry * 0.85
     val_profit = val_entry * 1.3
     
-    return {
-        "mom": {"entry": mom_entry, "stop": mom_stop, "profit": mom_profit},
-        "val": {"entry": val_entry, "stop": val_stop, "profit": val_profit}
-    }
+    return mom_entry, mom_stop, mom_profit, val_entry, val_stop, val_profit
 
 # ==========================================
 # 4. AI 服務層 (AI Service)
 # ==========================================
 
+GEMINI_MODEL = 'gemini-2.0-flash'
+AI_GENERATION_CONFIG = {"max_output_tokens": 900, "temperature": 0.4}
+
 def get_kline_narrative(df):
-    """生成 K 線語言供 AI 閱讀"""
-    lines = []
-    subset = df.tail(5)
-    for index, row in subset.iterrows():
-        date = index.strftime('%m/%d')
-        close = row['Close']
-        change = (close - row['Open']) / row['Open'] * 100
-        tag = "紅K" if change > 0 else "黑K"
-        lines.append(f"{date}: {close:.1f} ({tag}, 幅度{change:.1f}%)")
-    return " -> ".join(lines)
-
-def generate_ai_report(symbol, df, info, score, action, bias):
-    """Gemini 深度分析報告生成"""
+    """生成精簡 K 線型態碼供 AI 閱讀 (R 紅K / B 黑K / D 平盤，後接實體幅度%)"""
+    sub = df.tail(5)
+    open_ = sub['Open'].to_numpy()
+    close = sub['Close'].to_numpy()
+    chg = (close - open_) / open_ * 100
+    tags = np.where(chg > 0, 'R', np.where(chg < 0, 'B', 'D'))
+    return "|".join(f"{t}{c:+.1f}" for t, c in zip(tags, chg.tolist()))
+
+AI_REPORT_SPEC = """用繁體中文 Markdown，專業篤定、不要廢話，依序輸出：
+### 🎯 投資決策儀表板
+核心訊號、勝率預估、盈虧比、技術格局、一句話快評
+### ⚠️ 風險深度解析
+2 點具體風險
+### 🔍 多維度分析
+籌碼與主力意圖、技術結構與關鍵位、產業與估值
+### ⚔️ 戰術執行建議
+樂觀情境、悲觀情境、進場與止損規劃"""
+
+AI_BATCH_SIZE = 4  # 單次請求最多合併幾檔，再多報告品質與延遲都會變差
+
+@st.cache_resource
+def _get_genai_client(api_key):
+    return google_genai.Client(api_key=api_key)
+
+def _get_gemini_client():
+    """串流、同步批次與 Batch API 共用同一個 google-genai Client，未設定金鑰時回傳 None"""
     api_key = st.secrets.get("GEMINI_API_KEY")
-    if not api_key:
-        return "⚠️ 請先設定 Streamlit Secrets GEMINI_API_KEY"
+    if not api_key: return None
+    return _get_genai_client(api_key)
+
+def _stock_context(symbol, df, info, stats, score, action):
+    """個股量化摘要 (單檔與批次報告共用)"""
+    return (
+        f"{info.get('longName', symbol)} ({symbol})\n"
+        f"數據：現價 {stats.curr:.2f}｜乖離 {stats.bias:.1f}%｜評分 {score} ({action})｜季高 {stats.hi60:.1f}｜季低 {stats.lo60:.1f}｜季最大量價 {stats.hivol_price:.1f}｜PE {info.get('trailingPE','N/A')}｜ROE {info.get('returnOnEquity','N/A')}\n"
+        f"近5日K線 (R紅/B黑/D平, 實體%)：{get_kline_narrative(df)}"
+    )
+
+def _report_prompt(symbol, df, info, stats, score, action):
+    context = _stock_context(symbol, df, info, stats, score, action)
+    return f"你是華爾街傳奇對沖基金經理，診斷以下台股：\n{context}\n\n{AI_REPORT_SPEC}"
+
+def generate_ai_report_stream(prompt):
+    """Gemini 深度分析報告生成 (串流逐段輸出，錯誤交由呼叫端處理)"""
+    client = _get_gemini_client()
+    for chunk in client.models.generate_content_stream(model=GEMINI_MODEL, contents=prompt, config=AI_GENERATION_CONFIG):
+        if chunk.text: yield chunk.text
+
+class _ReportNotCached(Exception):
+    """AI 報告快取未命中"""
+
+@st.cache_data(persist="disk", max_entries=500, show_spinner=False)
+def _cached_report(prompt, _report=None):
+    """
+    Gemini 報告快取 (持久化至磁碟)，以 prompt 為鍵 (prompt 由代號、最後交易日、評分與乖離決定，新 K 棒即換鍵)
+    不帶 _report 時只查快取、不呼叫 API，未命中拋出 _ReportNotCached (例外不會被快取)；串流完成後以 _report 傳入全文寫回
+    """
+    if _report is None: raise _ReportNotCached(prompt)
+    return _report
+
+def generate_ai_report(symbol, df, info, stats, score, action, refresh=False):
+    """
+    顯示個股 AI 報告：快取 (含重啟前寫入磁碟者) 命中直接顯示，否則即時串流並寫回快取
+    refresh=True 時先清掉這份報告的快取再重新生成
+    """
+    if not st.secrets.get("GEMINI_API_KEY"):
+        st.warning("⚠️ 請先設定 Streamlit Secrets GEMINI_API_KEY")
+        return
+    
+    prompt = _report_prompt(symbol, df, info, stats, score, action)
+    if refresh:
+        _cached_report.clear(prompt)
     
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.0-flash')
-        
-        current_price = df['Close'].iloc[-1]
-        high_60 = df['Close'].tail(60).max()
-        low_60 = df['Close'].tail(60).min()
-        k_narrative = get_kline_narrative(df)
-        
-        prompt = f"""
-        你是一位華爾街傳奇對沖基金經理，請對台股 {info.get('longName', symbol)} ({symbol}) 進行深度診斷。
+        st.markdown(_cached_report(prompt))
+        return
+    except _ReportNotCached:
+        pass
+    
+    try:
+        report = st.write_stream(generate_ai_report_stream(prompt))
+        _cached_report(prompt, _report=report)
+    except Exception as e:
+        st.error(f"AI 連線失敗: {str(e)}")
+
+def generate_ai_reports_batch(stocks):
+    """
+    多檔合併為單次 Gemini 請求 (每批最多 AI_BATCH_SIZE 檔)，依輸入順序回傳報告列表
+    stocks: analyze_stock() 的回傳值列表
+    """
+    client = _get_gemini_client()
+    if not client:
+        return ["⚠️ 請先設定 Streamlit Secrets GEMINI_API_KEY"] * len(stocks)
+    
+    reports = []
+    for start in range(0, len(stocks), AI_BATCH_SIZE):
+        batch = stocks[start:start + AI_BATCH_SIZE]
+        blocks = "\n".join(
+            f"## Stock {i}\n" + _stock_context(s['symbol'], s['df'], s['info'], s['stats'], s['score'], s['action'])
+            for i, s in enumerate(batch, 1)
+        )
+        prompt = (
+            f"你是華爾街傳奇對沖基金經理，逐一診斷以下 {len(batch)} 檔台股：\n{blocks}\n\n"
+            f"每檔報告格式：\n{AI_REPORT_SPEC}\n\n"
+            "每檔報告前後以 <<<STOCK 編號>>> 與 <<<END>>> 包住，編號對應上方 Stock 編號。"
+        )
+        config = dict(AI_GENERATION_CONFIG, max_output_tokens=AI_GENERATION_CONFIG["max_output_tokens"] * len(batch))
         
-        【量化數據】
-        - 現價：{current_price} (乖離率 {bias:.1f}%)
-        - 評分：{score} ({action})
-        - 區間：近季高 {high_60:.1f} / 近季低 {low_60:.1f}
-        - K線序列：{k_narrative}
-        - 基本面：PE {info.get('trailingPE','N/A')}, ROE {info.get('returnOnEquity','N/A')}
-
-        請用繁體中文，專業、篤定地輸出以下 Markdown 格式報告 (不要有廢話)：
-
-        ### 🎯 投資決策儀表板
-        - **核心訊號**：(給出明確方向)
-        - **勝率預估**：(例如 65%) / **盈虧比**：(例如 1:3)
-        - **技術格局**：(一句話形容，如：多頭排列回測支撐)
-        - **一句話快評**：(犀利的總結)
-
-        ### ⚠️ 風險深度解析
-        (條列 2 點具體風險，如籌碼鬆動、技術面破線等)
-
-        ### 🔍 多維度層層分析
-        1. **籌碼與主力意圖**：(分析主力是在吃貨還是出貨)
-        2. **技術結構與關鍵位**：(結合K線型態判斷)
-        3. **產業與基本面邏輯**：(簡述產業地位與估值)
-
-        ### ⚔️ 戰術執行建議
-        - **樂觀情境**：(若突破...)
-        - **悲觀情境**：(若跌破...)
-        - **操作規劃**：(具體的進場、止損邏輯)
-        """
+        try:
+            text = client.models.generate_content(model=GEMINI_MODEL, contents=prompt, config=config).text or ""
+        except Exception as e:
+            reports.extend([f"AI 連線失敗: {str(e)}"] * len(batch))
+            continue
         
-        with st.spinner("🧠 AI 專家正在進行多維度運算與邏輯辯證..."):
-            response = model.generate_content(prompt)
-            return response.text
-    except Exception as e:
-        return f"AI 連線失敗: {str(e)}"
+        parsed = {int(i): body.strip() for i, body in re.findall(r"<<<STOCK (\d+)>>>(.*?)<<<END>>>", text, re.S)}
+        for i in range(1, len(batch) + 1):
+            reports.append(parsed.get(i, "⚠️ AI 未回傳此檔報告"))
+    return reports
+
+def submit_batch_scan(prompts):
+    """
+    非即時的整批分析改走 Gemini Batch API (inline 請求，費用約為同步呼叫的一半)
+    回傳批次工作名稱，未設定金鑰時回傳 None
+    """
+    client = _get_gemini_client()
+    if not client: return None
+    job = client.batches.create(
+        model=GEMINI_MODEL,
+        src=[{"contents": [{"role": "user", "parts": [{"text": p}]}], "config": AI_GENERATION_CONFIG} for p in prompts]
+    )
+    return job.name
+
+BATCH_DEAD_STATES = {"JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"}  # 不會再有結果的終止狀態
+
+def fetch_batch_results(job_name):
+    """查詢批次工作，回傳 (狀態, 報告列表)；尚未成功完成時報告為 None"""
+    job = _get_gemini_client().batches.get(name=job_name)
+    state = job.state.name
+    if state != "JOB_STATE_SUCCEEDED": return state, None
+    
+    reports = []
+    for item in job.dest.inlined_responses:
+        reports.append(item.response.text if item.response else f"AI 分析失敗: {item.error}")
+    return state, reports
 
 # ==========================================
 # 5. UI 組件 (UI Components)
 # ==========================================
 
-def render_metric_card(label, value, delta, color_class):
-    st.markdown(f"""
+# 靜態外殼預先建成 Template，每次 rerun 只代入變動的數值
+_HEADER_TPL = string.Template("""
+<div class="glass-card" style="display: flex; justify-content: space-between; align-items: flex-end; background: linear-gradient(180deg, rgba(30,41,59,0.7) 0%, rgba(15,23,42,0.9) 100%);">
+    <div>
+        <span class="strategy-tag" style="color: #60a5fa; border-color: #60a5fa;">$sector</span>
+        <div style="font-size: 32px; font-weight: 900; margin-top: 10px;">$name <span style="font-size: 18px; color: #64748b;">$symbol</span></div>
+    </div>
+    <div style="text-align: right;">
+        <div class="font-num $color" style="font-size: 42px; font-weight: 900; line-height: 1;">$price</div>
+        <div class="font-num $color" style="font-size: 14px; font-weight: bold;">$change</div>
+    </div>
+</div>
+""")
+
+_STRATEGY_CARD_TPL = string.Template("""
+<div class="glass-card">
+    <h4 style="color: $color;">$title</h4>
+    <p style="font-size: 12px; color: #94a3b8;">$subtitle</p>
+    <hr style="border-color: rgba(255,255,255,0.1);">
+    <div style="display:flex; justify-content:space-between; margin-bottom:5px;"><span>建議進場</span> <b class="font-num text-white">$entry</b></div>
+    <div style="display:flex; justify-content:space-between; margin-bottom:5px;"><span>停損防守</span> <b class="font-num text-up">$stop</b></div>
+    <div style="display:flex; justify-content:space-between;"><span>目標停利</span> <b class="font-num text-down">$profit</b></div>
+</div>
+""")
+
+def render_strategy_card(title, color, subtitle, entry, stop, profit):
+    st.markdown(_STRATEGY_CARD_TPL.substitute(
+        title=title,
+        color=color,
+        subtitle=subtitle,
+        entry=f"{entry:.2f}",
+        stop=f"{stop:.2f}",
+        profit=f"{profit:.2f}"
+    ), unsafe_allow_html=True)
+
+_METRIC_CARD_TPL = string.Template("""
     <div class="glass-card" style="padding: 15px; text-align: center;">
-        <div style="font-size: 12px; color: #94a3b8; text-transform: uppercase; letter-spacing: 1px; margin-bottom: 5px;">{label}</div>
-        <div class="font-num {color_class}" style="font-size: 28px; font-weight: 900; line-height: 1;">{value}</div>
-        <div style="font-size: 12px; margin-top: 5px; font-weight: bold;" class="{color_class}">
-            {delta}
-        </div>
+        <div style="font-size: 12px; color: #94a3b8; text-transform: uppercase; letter-spacing: 1px; margin-bottom: 5px;">$label</div>
+        <div class="font-num $color" style="font-size: 28px; font-weight: 900; line-height: 1;">$value</div>
+        <div style="font-size: 12px; margin-top: 5px; font-weight: bold;" class="$color">$delta</div>
     </div>
-    """, unsafe_allow_html=True)
+""")
+
+def render_detail_header(metrics, **header):
+    """
+    個股頁頂部資訊卡 + 四格指標合成單一 st.html 區塊
+    metrics 為 (標題, 數值, 說明, 顏色 class) 的序列
+    """
+    cards = "".join(
+        _METRIC_CARD_TPL.substitute(label=label, value=value, delta=delta, color=color)
+        for label, value, delta, color in metrics
+    )
+    st.html(_HEADER_TPL.substitute(**header) + f'<div class="metric-grid">{cards}</div>')
+
+CHART_RANGES = {"3M": 60, "6M": 120, "1Y": 250}  # K 棒數
+
+_LAYOUT = dict(
+    height=450,
+    margin=dict(l=0, r=0, t=0, b=0),
+    paper_bgcolor='rgba(0,0,0,0)',
+    plot_bgcolor='rgba(0,0,0,0)',
+    xaxis_rangeslider_visible=False,
+    font=dict(color='#94a3b8'),
+    xaxis=dict(gridcolor='rgba(255,255,255,0.05)'),
+    yaxis=dict(gridcolor='rgba(255,255,255,0.05)')
+)
+
+@st.cache_data(hash_funcs={np.ndarray: lambda a: (a.shape, a[-1].tobytes())}, show_spinner=False)
+def build_chart(df_key, dates, ohlc, ma20, ma60):
+    """
+    建立 K 線 + 均線圖 (只在出現新 K 棒時重建)
+    dates 為交易所當地日期 (datetime64[D]) 的整數視圖，ohlc 欄位順序: Open, High, Low, Close
+    """
+    x = dates.view('datetime64[D]')
+    fig = go.Figure()
+    # K線
+    fig.add_trace(go.Candlestick(x=x, open=ohlc[:, 0], high=ohlc[:, 1], low=ohlc[:, 2], close=ohlc[:, 3], name='Price'))
+    # MA Lines (WebGL 繪製)
+    fig.add_trace(go.Scattergl(x=x, y=ma20, line=dict(color='#fbbf24', width=1), name='MA20'))
+    fig.add_trace(go.Scattergl(x=x, y=ma60, line=dict(color='#c084fc', width=1), name='MA60'))
+    
+    # 同一檔、同一區間重繪時保留使用者的縮放/平移狀態
+    fig.update_layout(**_LAYOUT, uirevision=f"{df_key}-{len(dates)}")
+    return fig
 
 def render_stock_list_item(stock, on_click_key):
     col1, col2, col3 = st.columns([1, 3, 2])
@@ -384,8 +718,8 @@ def render_stock_list_item(stock, on_click_key):
         st.markdown(f"""<div class="score-badge {score_cls}">{stock['score']}</div>""", unsafe_allow_html=True)
     with col2:
         st.markdown(f"""
-            <div style="font-weight: bold; font-size: 16px;">{stock['name']}</div>
-            <div class="font-num" style="font-size: 12px; color: #64748b;">{stock['id']}</div>
+            <div class="font-num" style="font-weight: bold; font-size: 16px;">{stock['id']}</div>
+            <div style="font-size: 12px; color: #64748b;">{get_sector_name(stock['id'])}</div>
         """, unsafe_allow_html=True)
     with col3:
         color = get_change_color(stock['change_pct'])
@@ -408,6 +742,73 @@ if 'watchlist' not in st.session_state:
 if 'current_view' not in st.session_state:
     st.session_state.current_view = None
 
+@st.fragment
+def _watchlist_sidebar():
+    """
+    側邊欄自選清單：刪除只重跑此片段，切換個股才需整頁 rerun
+    """
+    for stock_id in st.session_state.watchlist:
+        c1, c2 = st.columns([4, 1])
+        if c1.button(f"🔍 {stock_id}", key=f"nav_{stock_id}"):
+            st.session_state.current_view = stock_id
+            st.rerun()
+        if c2.button("✖", key=f"del_{stock_id}"):
+            st.session_state.watchlist.remove(stock_id)
+            st.rerun(scope="fragment")
+
+def _sector_scan_view():
+    """
+    板塊掃描進度與結果：掃描中逐檔列出已完成的代號，完成後改以評分表呈現
+    """
+    scan = st.session_state.sector_scan
+    pending, results = scan['pending'], scan['results']
+    was_pending = bool(pending)
+    try:
+        for future in as_completed(list(pending), timeout=0):
+            results[pending.pop(future)] = future.result()
+    except FuturesTimeoutError:
+        pass
+    
+    if was_pending and not pending:
+        # 最後一檔完成：整頁 rerun 一次以停止片段的定時重跑
+        st.rerun()
+    
+    sector_data = {code: s for code, s in results.items() if s}
+    if pending:
+        total = len(results) + len(pending)
+        with st.status(f"掃描 {scan['sector']} 板塊成分股 {len(results)}/{total}", state="running", expanded=True):
+            for s in sector_data.values():
+                render_stock_list_item(s, f"sector_{s['id']}")
+        return
+    
+    # 轉換為 DataFrame 用於顯示
+    rows = []
+    for s in sector_data.values():
+        rows.append({
+            "代號": s['id'],
+            "現價": s['price'],
+            "漲跌幅": f"{s['change_pct']:+.2f}%",
+            "Ace評分": s['score']
+        })
+    
+    if rows:
+        res_df = pd.DataFrame(rows).sort_values("Ace評分", ascending=False)
+        st.dataframe(
+            res_df,
+            column_config={
+                "Ace評分": st.column_config.ProgressColumn(
+                    "Ace評分",
+                    help="AI 量化綜合評分",
+                    format="%d",
+                    min_value=0,
+                    max_value=100,
+                ),
+            },
+            use_container_width=True
+        )
+    else:
+        st.warning("數據獲取失敗，請稍後再試。")
+
 # --- 側邊欄 (Sidebar) ---
 with st.sidebar:
     st.markdown("### ⚡ 台股智謀 V5.7")
@@ -423,14 +824,49 @@ with st.sidebar:
     
     # 自選清單列表 (簡易版)
     st.markdown("##### 📂 我的自選")
-    for stock_id in st.session_state.watchlist:
-        c1, c2 = st.columns([4, 1])
-        if c1.button(f"🔍 {stock_id}", key=f"nav_{stock_id}"):
-            st.session_state.current_view = stock_id
-            st.rerun()
-        if c2.button("✖", key=f"del_{stock_id}"):
-            st.session_state.watchlist.remove(stock_id)
-            st.rerun()
+    _watchlist_sidebar()
+
+    st.divider()
+    
+    # 清除快取：強制下一次 rerun 重新抓取行情與重算指標 (已付費生成的 AI 報告快取保留)
+    if st.button("🧹 清除快取", use_container_width=True):
+        for cached in (fetch_indices, fetch_stock_data_full, get_analysis_data, analyze_stock, _calc_indicators_cached, _suffix_table):
+            cached.clear()
+        st.session_state.pop('_wl_key', None)
+        st.rerun()
+    
+    # 排程整批分析 (Gemini Batch API，非即時)
+    if st.button("🌙 排程整批分析", use_container_width=True):
+        with st.spinner("正在整理自選股並送出批次..."):
+            stocks = [a for a in (analyze_stock(code, _time_bucket(60)) for code in st.session_state.watchlist) if a]
+            try:
+                job_name = submit_batch_scan([
+                    _report_prompt(s['symbol'], s['df'], s['info'], s['stats'], s['score'], s['action'])
+                    for s in stocks
+                ])
+                if job_name:
+                    st.session_state.batch_job = {"name": job_name, "symbols": [s['symbol'] for s in stocks]}
+                    st.session_state.batch_results = None
+                    st.success("已送出批次，稍後回來查看結果")
+                else:
+                    st.warning("⚠️ 請先設定 Streamlit Secrets GEMINI_API_KEY")
+            except Exception as e:
+                st.error(f"批次送出失敗: {str(e)}")
+    
+    if st.session_state.get('batch_job'):
+        if st.button("📬 批次結果好了嗎？", use_container_width=True):
+            try:
+                state, reports = fetch_batch_results(st.session_state.batch_job['name'])
+                if reports:
+                    st.session_state.batch_results = dict(zip(st.session_state.batch_job['symbols'], reports))
+                elif state in BATCH_DEAD_STATES:
+                    # 工作已失效，不再輪詢；需要時重新送出
+                    st.session_state.batch_job = None
+                    st.warning(f"批次已結束且無結果 ({state})，請重新排程")
+                else:
+                    st.info(f"批次狀態：{state}")
+            except Exception as e:
+                st.error(f"批次查詢失敗: {str(e)}")
 
 # --- 主畫面路由 ---
 
@@ -443,58 +879,48 @@ if st.session_state.current_view:
         st.session_state.current_view = None
         st.rerun()
 
-    data = get_analysis_data(target)
+    analysis = analyze_stock(target, _time_bucket(60))
     
-    if data:
-        df = calculate_technical_indicators(data['df'])
-        info = data['info']
-        score, action, reasons, bias = calculate_ace_score(df, info)
+    if analysis:
+        df, info, stats = analysis['df'], analysis['info'], analysis['stats']
+        score, action, reasons, bias = analysis['score'], analysis['action'], analysis['reasons'], analysis['bias']
         
         # 1. 頂部資訊卡 (Header Card)
-        last_close = df['Close'].iloc[-1]
-        change_pct = (last_close - df['Close'].iloc[-2]) / df['Close'].iloc[-2] * 100
+        last_close = stats.curr
+        change_pct = stats.change_pct
         color_cls = get_change_color(change_pct)
         
-        st.markdown(f"""
-        <div class="glass-card" style="display: flex; justify-content: space-between; align-items: flex-end; background: linear-gradient(180deg, rgba(30,41,59,0.7) 0%, rgba(15,23,42,0.9) 100%);">
-            <div>
-                <span class="strategy-tag" style="color: #60a5fa; border-color: #60a5fa;">{get_sector_name(target)}</span>
-                <div style="font-size: 32px; font-weight: 900; margin-top: 10px;">{info.get('longName', target)} <span style="font-size: 18px; color: #64748b;">{target}</span></div>
-            </div>
-            <div style="text-align: right;">
-                <div class="font-num {color_cls}" style="font-size: 42px; font-weight: 900; line-height: 1;">{last_close:.2f}</div>
-                <div class="font-num {color_cls}" style="font-size: 14px; font-weight: bold;">{change_pct:+.2f}%</div>
-            </div>
-        </div>
-        """, unsafe_allow_html=True)
-        
-        # 2. 核心數據指標 (Metrics Grid)
-        c1, c2, c3, c4 = st.columns(4)
-        with c1: render_metric_card("ACE 量化評分", score, action, get_score_class(score).replace("background: ", "").replace("score-", "text-")) # Hacky color mapping
-        with c2: render_metric_card("乖離率 (Bias)", f"{bias:.1f}%", "過熱" if bias > 10 else "超跌" if bias < -10 else "正常", "text-slate")
-        with c3: render_metric_card("RSI 強度", f"{df['RSI'].iloc[-1]:.0f}", "強勢區" if df['RSI'].iloc[-1]>70 else "弱勢區", "text-slate")
-        with c4: render_metric_card("成交量", f"{int(df['Volume'].iloc[-1]/1000)}K", "張", "text-slate")
+        # 2. 核心數據指標 (Metrics Grid)，與頂部資訊卡同一區塊輸出
+        render_detail_header(
+            [
+                ("ACE 量化評分", score, action, get_score_class(score).replace("background: ", "").replace("score-", "text-")), # Hacky color mapping
+                ("乖離率 (Bias)", f"{bias:.1f}%", "過熱" if bias > 10 else "超跌" if bias < -10 else "正常", "text-slate"),
+                ("RSI 強度", f"{stats.rsi:.0f}", "強勢區" if stats.rsi>70 else "弱勢區", "text-slate"),
+                ("成交量", f"{int(stats.vol/1000)}K", "張", "text-slate")
+            ],
+            sector=get_sector_name(target),
+            name=info.get('longName', target),
+            symbol=target,
+            color=color_cls,
+            price=f"{last_close:.2f}",
+            change=f"{change_pct:+.2f}%"
+        )
 
         # 3. 功能頁籤 (Tabs)
         tab_chart, tab_ai, tab_strategy = st.tabs(["📊 技術圖表", "🧠 AI 戰略報告", "🎯 操盤策略"])
         
         with tab_chart:
-            # Plotly Interactive Chart
-            fig = go.Figure()
-            # K線
-            fig.add_trace(go.Candlestick(x=df.index, open=df['Open'], high=df['High'], low=df['Low'], close=df['Close'], name='Price'))
-            # MA Lines
-            fig.add_trace(go.Scatter(x=df.index, y=df['MA20'], line=dict(color='#fbbf24', width=1), name='MA20'))
-            fig.add_trace(go.Scatter(x=df.index, y=df['MA60'], line=dict(color='#c084fc', width=1), name='MA60'))
+            # 只繪製可視區間 (指標仍以完整一年數據計算)
+            chart_range = st.radio("區間", list(CHART_RANGES), index=1, horizontal=True, label_visibility="collapsed")
+            plot_df = df.tail(CHART_RANGES[chart_range])
             
-            fig.update_layout(
-                height=450,
-                margin=dict(l=0, r=0, t=0, b=0),
-                paper_bgcolor='rgba(0,0,0,0)',
-                plot_bgcolor='rgba(0,0,0,0)',
-                xaxis_rangeslider_visible=False,
-                font=dict(color='#94a3b8'),
-                grid=dict(color='rgba(255,255,255,0.05)')
+            # Plotly Interactive Chart (傳 ndarray 而非 DataFrame，快取雜湊成本低)
+            fig = build_chart(
+                target,
+                plot_df.index.tz_localize(None).values.astype('datetime64[D]').view('i8'),
+                plot_df[['Open', 'High', 'Low', 'Close']].to_numpy(np.float32),
+                plot_df['MA20'].to_numpy(np.float32),
+                plot_df['MA60'].to_numpy(np.float32)
             )
             st.plotly_chart(fig, use_container_width=True)
             
@@ -510,40 +936,23 @@ if st.session_state.current_view:
             </div>
             """, unsafe_allow_html=True)
             
-            if st.button("✨ 啟動 AI 深度診斷", type="primary", use_container_width=True):
-                report = generate_ai_report(target, df, info, score, action, bias)
-                st.markdown(report)
+            b1, b2 = st.columns([4, 1])
+            run = b1.button("✨ 啟動 AI 深度診斷", type="primary", use_container_width=True)
+            refresh = b2.button("🔄 強制刷新", use_container_width=True)
+            if run or refresh:
+                generate_ai_report(target, df, info, stats, score, action, refresh=refresh)
             else:
                 st.info("點擊按鈕以生成即時分析報告 (需消耗 API 配額)")
 
         with tab_strategy:
             roe = info.get('returnOnEquity', 0) * 100 if info.get('returnOnEquity') else 0
-            strat = calculate_strategy(last_close, score, roe)
+            me, ms, mp, ve, vs, vp = calculate_strategy(last_close, score, roe)
             
             sc1, sc2 = st.columns(2)
             with sc1:
-                st.markdown(f"""
-                <div class="glass-card">
-                    <h4 style="color: #60a5fa;">🌊 波段動能策略</h4>
-                    <p style="font-size: 12px; color: #94a3b8;">適合短線操作，追蹤資金流向</p>
-                    <hr style="border-color: rgba(255,255,255,0.1);">
-                    <div style="display:flex; justify-content:space-between; margin-bottom:5px;"><span>建議進場</span> <b class="font-num text-white">{strat['mom']['entry']:.2f}</b></div>
-                    <div style="display:flex; justify-content:space-between; margin-bottom:5px;"><span>停損防守</span> <b class="font-num text-up">{strat['mom']['stop']:.2f}</b></div>
-                    <div style="display:flex; justify-content:space-between;"><span>目標停利</span> <b class="font-num text-down">{strat['mom']['profit']:.2f}</b></div>
-                </div>
-                """, unsafe_allow_html=True)
-            
+                render_strategy_card("🌊 波段動能策略", "#60a5fa", "適合短線操作，追蹤資金流向", me, ms, mp)
             with sc2:
-                st.markdown(f"""
-                <div class="glass-card">
-                    <h4 style="color: #34d399;">💰 價值投資策略</h4>
-                    <p style="font-size: 12px; color: #94a3b8;">適合中長線佈局，回調承接</p>
-                    <hr style="border-color: rgba(255,255,255,0.1);">
-                    <div style="display:flex; justify-content:space-between; margin-bottom:5px;"><span>建議進場</span> <b class="font-num text-white">{strat['val']['entry']:.2f}</b></div>
-                    <div style="display:flex; justify-content:space-between; margin-bottom:5px;"><span>停損防守</span> <b class="font-num text-up">{strat['val']['stop']:.2f}</b></div>
-                    <div style="display:flex; justify-content:space-between;"><span>目標停利</span> <b class="font-num text-down">{strat['val']['profit']:.2f}</b></div>
-                </div>
-                """, unsafe_allow_html=True)
+                render_strategy_card("💰 價值投資策略", "#34d399", "適合中長線佈局，回調承接", ve, vs, vp)
 
     else:
         st.error("無法獲取數據，請確認代號正確。")
@@ -556,22 +965,15 @@ else:
     ic1, ic2, ic3 = st.columns(3)
     indices = {"^TWII": "加權指數", "^IXIC": "那斯達克", "^SOX": "費城半導體"}
     
+    idx_quotes = fetch_indices(tuple(indices))
+
     for idx, (sym, name) in enumerate(indices.items()):
-        df_idx, _ = fetch_stock_data_full([sym])
-        if not df_idx: continue
-        d = df_idx[sym] # fetch_stock_data_full returns dict, wait, my impl returns single? no it returns map
-        # Wait, fetch_stock_data_full returns map. but fetch_stock_data (single) returns df, info.
-        # Let's fix this quickly. I'll just use a quick fetch here.
-        ticker = yf.Ticker(sym)
-        hist = ticker.history(period="5d")
-        if not hist.empty:
-            curr = hist['Close'].iloc[-1]
-            prev = hist['Close'].iloc[-2]
-            chg = (curr - prev)/prev*100
-            color = get_change_color(chg).replace("text-", "") # Hack for st.metric delta_color
-            
-            with [ic1, ic2, ic3][idx]:
-                st.metric(name, f"{curr:,.0f}", f"{chg:+.2f}%")
+        d = idx_quotes.get(sym)
+        if not d: continue
+        curr, chg = d['price'], d['change_pct']
+
+        with [ic1, ic2, ic3][idx]:
+            st.metric(name, f"{curr:,.0f}", f"{chg:+.2f}%")
 
     st.markdown("---")
 
@@ -580,54 +982,78 @@ else:
     
     # 批量抓取自選股數據以提升效能
     if st.session_state.watchlist:
-        wl_data = fetch_stock_data_full(st.session_state.watchlist)
+        # 清單與時間桶未變時直接沿用上次的行情與排序結果 (時間桶讓資料每 5 分鐘換新)
+        wl_key = (tuple(sorted(st.session_state.watchlist)), _time_bucket(300))
+        if st.session_state.get('_wl_key') != wl_key:
+            wl_data = fetch_stock_data_full(wl_key[0])
+            st.session_state._wl_key = wl_key
+            # 排序：評分高到低
+            st.session_state._wl_sorted = sorted(wl_data.values(), key=lambda x: x['score'], reverse=True)
+        sorted_wl = st.session_state._wl_sorted
         
-        # 排序：評分高到低
-        sorted_wl = sorted(wl_data.values(), key=lambda x: x['score'], reverse=True)
+        # 單一表格呈現 (取代逐列 columns/markdown/button)，點選列即進入個股頁
+        if sorted_wl:
+            wl_df = pd.DataFrame(sorted_wl)[['id', 'price', 'change_pct', 'score']]
+            event = st.dataframe(
+                wl_df,
+                column_config={
+                    "id": st.column_config.TextColumn("代號"),
+                    "price": st.column_config.NumberColumn("現價", format="%.2f"),
+                    "change_pct": st.column_config.NumberColumn("漲跌幅", format="%+.2f%%"),
+                    "score": st.column_config.ProgressColumn(
+                        "Ace評分",
+                        help="AI 量化綜合評分",
+                        format="%d",
+                        min_value=0,
+                        max_value=100,
+                    ),
+                },
+                use_container_width=True,
+                hide_index=True,
+                on_select="rerun",
+                selection_mode="single-row",
+                key="wl_table"
+            )
+            if event.selection.rows:
+                st.session_state.current_view = wl_df['id'].iloc[event.selection.rows[0]]
+                st.rerun()
+        else:
+            st.warning("數據獲取失敗，請稍後再試。")
         
-        for stock in sorted_wl:
-            render_stock_list_item(stock, f"wl_{stock['id']}")
+        # 自選股批次 AI 診斷 (每 4 檔合併一次請求)
+        if st.button("🧠 一鍵診斷全部自選", use_container_width=True):
+            with st.spinner("🧠 AI 專家正在批次診斷自選股..."):
+                stocks = [a for a in (analyze_stock(code, _time_bucket(60)) for code in st.session_state.watchlist) if a]
+                reports = generate_ai_reports_batch(stocks)
+            for stock, report in zip(stocks, reports):
+                with st.expander(f"{stock['info'].get('longName', stock['symbol'])} ({stock['symbol']}) · {stock['score']} {stock['action']}"):
+                    st.markdown(report)
     else:
         st.info("您的自選清單為空，請從左側新增。")
 
+    # 排程整批分析結果
+    if st.session_state.get('batch_results'):
+        st.markdown("##### 🌙 排程整批分析結果")
+        for stock_id, report in st.session_state.batch_results.items():
+            with st.expander(stock_id):
+                st.markdown(report)
+
     st.markdown("---")
     
     # 3. 產業板塊熱力 (Sector Heatmap)
     st.markdown("### 🔥 產業板塊熱力")
     
-    selected_sector = st.selectbox("選擇板塊進行掃描", list(SECTOR_MAP.keys()))
+    selected_sector = st.selectbox("選擇板塊進行掃描", _SECTOR_KEYS)
     
     if st.button("🚀 掃描該板塊"):
-        with st.spinner(f"正在掃描 {selected_sector} 板塊成分股..."):
-            sector_stocks = SECTOR_MAP[selected_sector]
-            sector_data = fetch_stock_data_full(sector_stocks)
-            
-            # 轉換為 DataFrame 用於顯示
-            rows = []
-            for s in sector_data.values():
-                rows.append({
-                    "代號": s['id'],
-                    "名稱": s['name'],
-                    "現價": s['price'],
-                    "漲跌幅": f"{s['change_pct']:+.2f}%",
-                    "Ace評分": s['score']
-                })
-            
-            if rows:
-                res_df = pd.DataFrame(rows).sort_values("Ace評分", ascending=False)
-                st.dataframe(
-                    res_df,
-                    column_config={
-                        "Ace評分": st.column_config.ProgressColumn(
-                            "Ace評分",
-                            help="AI 量化綜合評分",
-                            format="%d",
-                            min_value=0,
-                            max_value=100,
-                        ),
-                    },
-                    use_container_width=True
-                )
-            else:
-                st.warning("數據獲取失敗，請稍後再試。")
-
+        # 上市櫃別先批量判斷一次，背景執行緒再逐檔抓取，頁面不凍結；結果於後續 rerun 逐檔出現
+        resolve_suffixes(SECTOR_MAP[selected_sector])
+        st.session_state.sector_scan = {
+            "sector": selected_sector,
+            "pending": {_POOL.submit(_fetch_one, code): code for code in SECTOR_MAP[selected_sector]},
+            "results": {}
+        }
+    
+    if st.session_state.get('sector_scan'):
+        # 掃描中以片段定時重跑輪詢背景結果 (不重跑整頁)，完成後不再定時
+        st.fragment(_sector_scan_view, run_every=0.5 if st.session_state.sector_scan['pending'] else None)()
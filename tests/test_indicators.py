@@ -0,0 +1,88 @@
+import importlib
+import importlib.util
+import pathlib
+import sys
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+
+
+def _load(block_numba):
+    """
+    載入 _indicators；block_numba=True 時模擬未安裝 numba，另行載入一份向量化版本
+    numba 版本必須以正式模組名匯入，cache=True 寫入的快取才與 App 共用同一個模組
+    """
+    if not block_numba:
+        if str(ROOT) not in sys.path:
+            sys.path.insert(0, str(ROOT))
+        return importlib.import_module("_indicators")
+    spec = importlib.util.spec_from_file_location("_indicators_fallback", ROOT / "_indicators.py")
+    module = importlib.util.module_from_spec(spec)
+    with mock.patch.dict(sys.modules, {"numba": None}):
+        spec.loader.exec_module(module)
+    return module
+
+
+def _variants():
+    yield pytest.param(True, id="fallback")
+    try:
+        import numba  # noqa: F401
+    except ImportError:
+        yield pytest.param(False, id="numba", marks=pytest.mark.skip(reason="numba not installed"))
+    else:
+        yield pytest.param(False, id="numba")
+
+
+@pytest.fixture(params=list(_variants()))
+def ind(request):
+    module = _load(request.param)
+    assert module.HAS_NUMBA is not request.param
+    return module
+
+
+@pytest.fixture
+def close():
+    rng = np.random.default_rng(0)
+    return 600 + np.cumsum(rng.normal(0, 5, 300))
+
+
+def _wilder_rsi(close, n):
+    """參考實作：前 n 個漲跌幅取簡單平均做種子，之後 pandas ewm(alpha=1/n, adjust=False)"""
+    delta = pd.Series(close).diff()
+    out = []
+    for x in (delta.clip(lower=0), (-delta).clip(lower=0)):
+        seeded = x.copy()
+        seeded.iloc[:n] = np.nan
+        seeded.iloc[n] = x.iloc[1:n + 1].mean()
+        out.append(seeded.ewm(alpha=1 / n, adjust=False).mean())
+    gain, loss = out
+    return (100 - 100 / (1 + gain / loss)).to_numpy()
+
+
+@pytest.mark.parametrize("w", [5, 20, 60])
+def test_ma_matches_pandas_rolling(ind, close, w):
+    expected = pd.Series(close).rolling(w).mean().to_numpy()
+    np.testing.assert_allclose(ind._ma(close, w), expected, rtol=1e-10, equal_nan=True)
+
+
+def test_rolling_std_matches_pandas_rolling(ind, close):
+    ma = ind._ma(close, 20)
+    expected = pd.Series(close).rolling(20).std(ddof=0).to_numpy()
+    np.testing.assert_allclose(ind._rolling_std(close, 20, ma), expected, rtol=1e-8, equal_nan=True)
+
+
+def test_rsi_matches_wilder_ewm(ind, close):
+    np.testing.assert_allclose(ind._rsi(close, 14), _wilder_rsi(close, 14), rtol=1e-10, equal_nan=True)
+
+
+def test_rsi_short_input_is_all_nan(ind):
+    assert np.isnan(ind._rsi(np.arange(10, dtype=np.float64), 14)).all()
+
+
+def test_bias(ind, close):
+    ma = pd.Series(close).rolling(20).mean().to_numpy()
+    np.testing.assert_allclose(ind._bias(close, ma), (close - ma) / ma * 100, equal_nan=True)